@@ -2,7 +2,8 @@
 # Folder-based RAG over: PDF, images, text files, CSV, Excel (multi-sheet)
 # OCR via Ollama vision model, embeddings via Ollama embeddings, FAISS store, QA via Ollama text model
 
-import os, re, io, csv, json, pickle, hashlib
+import os, re, io, csv, json, hashlib, time, random
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from dataclasses import dataclass
 from typing import List, Dict, Any, Optional
 
@@ -11,10 +12,17 @@ from tqdm import tqdm
 from PIL import Image
 import ollama
 
+# One shared client for OCR, QA and embeddings: every request reuses the
+# same pooled HTTP connection instead of reconnecting, and keep_alive
+# stops Ollama from unloading the models between calls.
+OLLAMA_KEEP_ALIVE = "30m"
+_ollama = ollama.Client(timeout=300.0)
+
 try:
-    from pdf2image import convert_from_path
+    from pdf2image import convert_from_path, pdfinfo_from_path
 except Exception:
     convert_from_path = None
+    pdfinfo_from_path = None
 
 # NEW: pandas for Excel
 try:
@@ -22,6 +30,31 @@ try:
 except Exception:
     pd = None
 
+# Rust-based Excel reader, 5-10x faster than openpyxl (pip install
+# python-calamine); pandas accepts engine="calamine" only from 2.2, so
+# older pandas keeps engine=None (auto-detect) even with it installed.
+try:
+    import python_calamine  # noqa: F401
+    _pd_version = tuple(int(x) for x in pd.__version__.split(".")[:2])
+    EXCEL_ENGINE = "calamine" if _pd_version >= (2, 2) else None
+except Exception:
+    EXCEL_ENGINE = None
+
+# pyarrow's multithreaded CSV reader; csv.reader fallback in the ingest loop
+try:
+    import pyarrow as pa
+    import pyarrow.compute  # noqa: F401 -- binds pa.compute; pandas may be absent
+    import pyarrow.csv as pa_csv
+except Exception:
+    pa = None
+    pa_csv = None
+
+# numba for the hot text paths; pure-Python fallback below if missing
+try:
+    from numba import njit
+except Exception:
+    njit = None
+
 
 @dataclass
 class PipelineConfig:
@@ -33,23 +66,107 @@ class PipelineConfig:
 
     dpi: int = 220
     max_ocr_img_side: int = 1600
+    ocr_concurrency: int = 3
 
     chunk_chars: int = 1200
     chunk_overlap: int = 200
 
+    embed_batch_size: int = 32
+    embed_concurrency: int = 4
+    io_prefetch: int = 8
+
     top_k: int = 10
 
+    # ANN index used above the threshold; small corpora stay on exact search.
+    index_factory: str = "IVF256,PQ32"
+    index_factory_min_vectors: int = 10000
+    nprobe: int = 16
+    # Storage for the sub-threshold exact index: "fp16" halves RAM,
+    # "sq8" quarters it, "none" keeps full float32.
+    quantizer: str = "fp16"
+
     work_dir: str = "rag_store"
     index_name: str = "faiss.index"
-    meta_name: str = "meta.pkl"
+    meta_name: str = "meta.npz"
+    meta_blob_name: str = "meta.blob"
     manifest_name: str = "manifest.json"
+    cache_name: str = "cache"
 
 
 def ensure_dir(p: str) -> None:
     os.makedirs(p, exist_ok=True)
 
 
+if njit is not None:
+
+    @njit(cache=True)
+    def _normalize_ws_bytes(src):
+        # Single-pass equivalent of the regex pipeline below, over UTF-8
+        # bytes: CR/CRLF -> LF, runs of space/tab -> one space, newline
+        # runs capped at two, then whitespace trimmed at both ends.
+        # Multi-byte UTF-8 units are >= 0x80 and pass through untouched.
+        n = src.size
+        out = np.empty(n, dtype=np.uint8)
+        m = 0
+        nl_run = 0
+        i = 0
+        while i < n:
+            b = src[i]
+            if b == 13:  # \r, swallow a following \n
+                if i + 1 < n and src[i + 1] == 10:
+                    i += 1
+                b = 10
+            if b == 32 or b == 9:
+                while i + 1 < n and (src[i + 1] == 32 or src[i + 1] == 9):
+                    i += 1
+                out[m] = 32
+                m += 1
+                nl_run = 0
+            elif b == 10:
+                nl_run += 1
+                if nl_run <= 2:
+                    out[m] = 10
+                    m += 1
+            else:
+                out[m] = b
+                m += 1
+                nl_run = 0
+            i += 1
+        s = 0
+        e = m
+        while s < e and (out[s] == 32 or out[s] == 10):
+            s += 1
+        while e > s and (out[e - 1] == 32 or out[e - 1] == 10):
+            e -= 1
+        return out[s:e]
+
+    @njit(cache=True)
+    def _chunk_offsets(n, chunk_chars, overlap):
+        # (start, end) pairs in character space; same walk as the
+        # fallback loop in chunk_text.
+        cap = n // max(1, chunk_chars - overlap) + 2
+        offs = np.empty((cap, 2), dtype=np.int64)
+        k = 0
+        start = 0
+        while start < n:
+            end = min(n, start + chunk_chars)
+            offs[k, 0] = start
+            offs[k, 1] = end
+            k += 1
+            if end == n:
+                break
+            start = max(0, end - overlap)
+        return offs[:k]
+
+else:
+    _normalize_ws_bytes = None
+    _chunk_offsets = None
+
+
 def normalize_ws(text: str) -> str:
+    if _normalize_ws_bytes is not None:
+        arr = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        return bytes(_normalize_ws_bytes(arr)).decode("utf-8")
     text = text.replace("\r\n", "\n").replace("\r", "\n")
     text = re.sub(r"[ \t]+", " ", text)
     text = re.sub(r"\n{3,}", "\n\n", text)
@@ -60,6 +177,8 @@ def chunk_text(text: str, chunk_chars: int, overlap: int) -> List[str]:
     text = normalize_ws(text)
     if not text:
         return []
+    if _chunk_offsets is not None:
+        return [text[s:e] for s, e in _chunk_offsets(len(text), chunk_chars, overlap)]
     chunks = []
     start = 0
     while start < len(text):
@@ -71,27 +190,61 @@ def chunk_text(text: str, chunk_chars: int, overlap: int) -> List[str]:
     return chunks
 
 
+def make_chunker(chunk_chars: int, overlap: int):
+    # Specializes chunk_text for one fixed (chunk_chars, overlap) pair —
+    # the config is constant for a whole ingest, so the per-text work
+    # reduces to a straight stride walk with the bounds precomputed.
+    stride = max(1, chunk_chars - overlap)
+
+    def chunker(text: str) -> List[str]:
+        text = normalize_ws(text)
+        n = len(text)
+        if n == 0:
+            return []
+        if n <= chunk_chars:
+            return [text]
+        if _chunk_offsets is not None:
+            return [text[s:e] for s, e in _chunk_offsets(n, chunk_chars, overlap)]
+        return [text[i:i + chunk_chars] for i in range(0, n - overlap, stride)]
+
+    return chunker
+
+
 def downscale_image(img: Image.Image, max_side: int) -> Image.Image:
     w, h = img.size
     m = max(w, h)
     if m <= max_side:
         return img
     scale = max_side / m
-    return img.resize((int(w * scale), int(h * scale)), Image.BICUBIC)
+    # LANCZOS: comparable cost to bicubic in stock Pillow, and it is the
+    # SIMD-accelerated resampler when Pillow-SIMD is installed.
+    return img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
 
 
 def pil_to_png_bytes(img: Image.Image) -> bytes:
     buf = io.BytesIO()
-    img.save(buf, format="PNG")
+    # Fast zlib level: the bytes are only in-flight to Ollama, not stored.
+    img.save(buf, format="PNG", compress_level=1)
     return buf.getvalue()
 
 
+def _render_pdf_page(path: str, page: int, dpi: int, poppler_path: Optional[str]) -> Image.Image:
+    # Module-level so ProcessPoolExecutor can pickle it. Poppler is
+    # thread-hostile in-process but safe across worker processes.
+    return convert_from_path(path, dpi=dpi, poppler_path=poppler_path,
+                             first_page=page, last_page=page)[0]
+
+
 def sha256_file(path: str) -> str:
-    h = hashlib.sha256()
     with open(path, "rb") as f:
-        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+        if hasattr(hashlib, "file_digest"):  # Python 3.11+, zero-copy C reader
+            return hashlib.file_digest(f, "sha256").hexdigest()
+        h = hashlib.sha256()
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
             h.update(chunk)
-    return h.hexdigest()
+        return h.hexdigest()
 
 
 class OllamaOCR:
@@ -111,29 +264,65 @@ class OllamaOCR:
             "- Do not add commentary.\n"
         )
 
-        resp = ollama.chat(
+        resp = _ollama.chat(
             model=self.model,
             messages=[{
                 "role": "user",
                 "content": prompt,
                 "images": [img_bytes],
             }],
+            keep_alive=OLLAMA_KEEP_ALIVE,
         )
         return normalize_ws(resp["message"]["content"])
 
 
 class OllamaEmbedder:
-    def __init__(self, model: str):
+    def __init__(self, model: str, batch_size: int = 32, concurrency: int = 4):
         self.model = model
+        self.batch_size = batch_size
+        self.concurrency = max(1, concurrency)
 
     def embed(self, texts: List[str]) -> np.ndarray:
-        vecs = []
-        for t in tqdm(texts, desc="Embedding (Ollama)"):
-            r = ollama.embeddings(model=self.model, prompt=t)
-            v = np.asarray(r["embedding"], dtype=np.float32)
-            v = v / (np.linalg.norm(v) + 1e-12)
-            vecs.append(v)
-        return np.vstack(vecs)
+        starts = list(range(0, len(texts), self.batch_size))
+        batches = [texts[s:s + self.batch_size] for s in starts]
+
+        # The first batch sizes the output; the rest write straight into
+        # their slots, so there is no list-of-arrays + vstack copy.
+        first = self._embed_batch(batches[0])
+        V = np.empty((len(texts), first.shape[1]), dtype=np.float32)
+        V[:len(batches[0])] = first
+
+        def run(slot: int) -> None:
+            # Tiny jitter so concurrent workers don't hit the server in lockstep.
+            time.sleep(random.uniform(0, 0.05))
+            V[starts[slot]:starts[slot] + len(batches[slot])] = self._embed_batch(batches[slot])
+
+        with ThreadPoolExecutor(max_workers=self.concurrency) as ex:
+            futures = [ex.submit(run, slot) for slot in range(1, len(batches))]
+            for fut in tqdm(futures, desc="Embedding (Ollama)"):
+                fut.result()
+        V /= (np.linalg.norm(V, axis=1, keepdims=True) + 1e-12)
+        return V
+
+    def embed_one(self, text: str) -> np.ndarray:
+        # Interactive fast path: one roundtrip, no thread pool, progress
+        # bar or matrix allocation.
+        v = self._embed_batch([text])[0]
+        v /= (np.linalg.norm(v) + 1e-12)
+        return v
+
+    def _embed_batch(self, batch: List[str]) -> np.ndarray:
+        # One /api/embed roundtrip per batch instead of one /api/embeddings
+        # per text; returns raw (unnormalized) float32 rows.
+        rows = None
+        if hasattr(_ollama, "embed"):
+            r = _ollama.embed(model=self.model, input=batch, keep_alive=OLLAMA_KEEP_ALIVE)
+            rows = r.get("embeddings") if hasattr(r, "get") else getattr(r, "embeddings", None)
+        if rows is None:
+            # Old client/server without /api/embed: fall back to per-text calls.
+            rows = [_ollama.embeddings(model=self.model, prompt=t, keep_alive=OLLAMA_KEEP_ALIVE)["embedding"]
+                    for t in batch]
+        return np.asarray(rows, dtype=np.float32)
 
 
 class FaissStore:
@@ -142,26 +331,135 @@ class FaissStore:
         self.faiss = faiss
         self.index = None
         self.dim = None
+        self.factory = None
 
-    def build(self, vectors: np.ndarray) -> None:
+    def build(self, vectors: np.ndarray, factory: Optional[str] = None, quantizer: str = "none") -> None:
+        vectors = vectors.astype(np.float32)
         self.dim = vectors.shape[1]
-        self.index = self.faiss.IndexFlatIP(self.dim)
-        self.index.add(vectors.astype(np.float32))
-
-    def search(self, query_vec: np.ndarray, top_k: int):
+        if factory:
+            self.index = self.faiss.index_factory(self.dim, factory, self.faiss.METRIC_INNER_PRODUCT)
+            self.factory = factory
+        elif quantizer in ("fp16", "sq8"):
+            # Exact search over scalar-quantized codes; queries stay fp32
+            # and FAISS dequantizes in its SIMD kernels.
+            qt = (self.faiss.ScalarQuantizer.QT_fp16 if quantizer == "fp16"
+                  else self.faiss.ScalarQuantizer.QT_8bit)
+            self.index = self.faiss.IndexScalarQuantizer(self.dim, qt, self.faiss.METRIC_INNER_PRODUCT)
+            self.factory = "SQfp16" if quantizer == "fp16" else "SQ8"
+        else:
+            self.index = self.faiss.IndexFlatIP(self.dim)
+            self.factory = "Flat"
+        if not self.index.is_trained:
+            self.index.train(vectors)
+        self.index.add(vectors)
+
+    def search(self, query_vec: np.ndarray, top_k: int, nprobe: Optional[int] = None):
         if query_vec.ndim == 1:
             query_vec = query_vec[None, :]
+        if nprobe is not None and hasattr(self.index, "nprobe"):
+            self.index.nprobe = nprobe
         D, I = self.index.search(query_vec.astype(np.float32), top_k)
         return D[0], I[0]
 
     def save(self, path: str) -> None:
+        # A plain write is already mmap-able on load for IVF/HNSW via the
+        # IO_FLAG_MMAP path in load(); IO_FLAG_ONDISK_SAME_DIR is a
+        # read-side flag for indexes built with OnDiskInvertedLists and
+        # does not change what write_index emits.
         self.faiss.write_index(self.index, path)
 
     def load(self, path: str) -> None:
-        self.index = self.faiss.read_index(path)
+        # Memory-map when the index type supports it (IVF*/HNSW); flat
+        # indexes and old FAISS builds fall back to a full read.
+        flags = getattr(self.faiss, "IO_FLAG_MMAP", 0) | getattr(self.faiss, "IO_FLAG_READ_ONLY", 0)
+        try:
+            self.index = self.faiss.read_index(path, flags)
+        except RuntimeError:
+            self.index = self.faiss.read_index(path)
         self.dim = self.index.d
 
 
+FILE_TYPES = ("pdf", "image", "text", "csv", "excel")
+
+
+class MetaStore:
+    # Columnar chunk metadata (struct-of-arrays): one npz of parallel
+    # columns plus a single UTF-8 blob sliced by offset for chunk text.
+    # Tags are rebuilt on access instead of being stored per row, and a
+    # query materializes only the top_k rows it touches.
+
+    def __init__(self, npz_path: str, blob_path: str):
+        cols = np.load(npz_path, allow_pickle=False)
+        self.rels = cols["rels"]
+        self.sheets = cols["sheets"]
+        self.file_types = cols["file_types"]
+        self.pages = cols["pages"]
+        self.rows = cols["rows"]
+        self.chunk_ids = cols["chunk_ids"]
+        self.vec_ids = cols["vec_ids"]
+        self.offsets = cols["offsets"]
+        self.blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+
+    def __len__(self) -> int:
+        return len(self.chunk_ids)
+
+    def rows_for_vec(self, vec_id: int) -> List[int]:
+        # All meta rows sharing one FAISS row (deduplicated chunks).
+        return np.nonzero(self.vec_ids == vec_id)[0].tolist()
+
+    @staticmethod
+    def _tag(rel: str, file_type: str, page: int, row: int, sheet: str, chunk_id: int) -> str:
+        if file_type == "pdf":
+            return f"[file:{rel} p{page:03d} c{chunk_id:03d}]"
+        if file_type == "csv":
+            return f"[file:{rel} row{row:03d} c{chunk_id:03d}]"
+        if file_type == "excel":
+            return f"[file:{rel} sheet:{sheet} row{row:03d} c{chunk_id:03d}]"
+        return f"[file:{rel} c{chunk_id:03d}]"
+
+    def __getitem__(self, i: int) -> Dict[str, Any]:
+        i = int(i)
+        rel = str(self.rels[i])
+        sheet = str(self.sheets[i])
+        ft = FILE_TYPES[self.file_types[i]]
+        page = int(self.pages[i])
+        row = int(self.rows[i])
+        ci = int(self.chunk_ids[i])
+        d = {
+            "rel": rel,
+            "file_type": ft,
+            "page": page if page >= 0 else None,
+            "chunk_id": ci,
+            "tag": self._tag(rel, ft, page, row, sheet, ci),
+            "text": bytes(self.blob[self.offsets[i]:self.offsets[i + 1]]).decode("utf-8"),
+        }
+        if ft in ("csv", "excel"):
+            d["row"] = row
+        if ft == "excel":
+            d["sheet"] = sheet
+        return d
+
+    @staticmethod
+    def write(rows: List[Dict[str, Any]], npz_path: str, blob_path: str) -> None:
+        texts = [r["text"].encode("utf-8") for r in rows]
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum([len(t) for t in texts], out=offsets[1:])
+        with open(blob_path, "wb") as f:
+            for t in texts:
+                f.write(t)
+        np.savez(
+            npz_path,
+            rels=np.array([r["rel"] for r in rows]),
+            sheets=np.array([r.get("sheet") or "" for r in rows]),
+            file_types=np.array([FILE_TYPES.index(r["file_type"]) for r in rows], dtype=np.int8),
+            pages=np.array([-1 if r.get("page") is None else r["page"] for r in rows], dtype=np.int32),
+            rows=np.array([-1 if r.get("row") is None else r["row"] for r in rows], dtype=np.int32),
+            chunk_ids=np.array([r["chunk_id"] for r in rows], dtype=np.int32),
+            vec_ids=np.array([r["vec_id"] for r in rows], dtype=np.int32),
+            offsets=offsets,
+        )
+
+
 class OllamaQA:
     def __init__(self, model: str):
         self.model = model
@@ -187,12 +485,13 @@ class OllamaQA:
             "Write the best possible answer with citations."
         )
 
-        resp = ollama.chat(
+        resp = _ollama.chat(
             model=self.model,
             messages=[
                 {"role": "system", "content": system},
                 {"role": "user", "content": user},
             ],
+            keep_alive=OLLAMA_KEEP_ALIVE,
         )
         return resp["message"]["content"].strip()
 
@@ -202,10 +501,13 @@ class RAGPipeline:
         self.cfg = cfg
         ensure_dir(cfg.work_dir)
         self.ocr = OllamaOCR(cfg.ocr_model, cfg.max_ocr_img_side)
-        self.embedder = OllamaEmbedder(cfg.embed_model)
+        self.embedder = OllamaEmbedder(cfg.embed_model, cfg.embed_batch_size, cfg.embed_concurrency)
         self.qa = OllamaQA(cfg.qa_model)
         self.store = FaissStore()
-        self.meta: List[Dict[str, Any]] = []
+        self._chunker = make_chunker(cfg.chunk_chars, cfg.chunk_overlap)
+        self._pdf_pool: Optional[ProcessPoolExecutor] = None
+        # Set by ingest_folder()/load(); query() requires it.
+        self.meta: Optional[MetaStore] = None
 
     def _manifest_path(self):
         return os.path.join(self.cfg.work_dir, self.cfg.manifest_name)
@@ -222,7 +524,170 @@ class RAGPipeline:
         with open(p, "w", encoding="utf-8") as f:
             json.dump(m, f, indent=2)
 
-    # NEW: helper to make a compact "col=value | col=value" row string
+    # Content-addressed caches: OCR text keyed by (file sha256, OCR model,
+    # dpi), embeddings keyed by (chunk sha256, embed model). Re-ingesting
+    # unchanged content skips both model calls entirely.
+
+    @staticmethod
+    def _model_hash(model: str) -> str:
+        return hashlib.sha256(model.encode("utf-8")).hexdigest()[:12]
+
+    def _ocr_cache_path(self, file_hash: str, page: int) -> str:
+        cdir = os.path.join(self.cfg.work_dir, self.cfg.cache_name, "ocr")
+        ensure_dir(cdir)
+        key = f"{file_hash}.{self._model_hash(self.cfg.ocr_model)}.{self.cfg.dpi}"
+        return os.path.join(cdir, f"{key}.p{page:04d}.txt")
+
+    def _ocr_cache_get(self, file_hash: str, page: int = 0) -> Optional[str]:
+        p = self._ocr_cache_path(file_hash, page)
+        if not os.path.exists(p):
+            return None
+        with open(p, "r", encoding="utf-8") as f:
+            return f.read()
+
+    def _ocr_cache_put(self, file_hash: str, page: int, text: str) -> None:
+        with open(self._ocr_cache_path(file_hash, page), "w", encoding="utf-8") as f:
+            f.write(text)
+
+    def _ocr_pages(self, file_hash: str, imgs: List[Image.Image]) -> List[str]:
+        texts: List[Optional[str]] = [self._ocr_cache_get(file_hash, i) for i in range(len(imgs))]
+        misses = [i for i, t in enumerate(texts) if t is None]
+        if misses:
+            fresh = self._ocr_batch([imgs[i] for i in misses])
+            for i, t in zip(misses, fresh):
+                texts[i] = t
+                self._ocr_cache_put(file_hash, i, t)
+        return texts
+
+    def _embed_cache_path(self, chunk: str) -> str:
+        h = hashlib.sha256(chunk.encode("utf-8")).hexdigest()
+        cdir = os.path.join(self.cfg.work_dir, self.cfg.cache_name, "emb", h[:2])
+        return os.path.join(cdir, f"{h}.{self._model_hash(self.cfg.embed_model)}.npy")
+
+    def _embed_cached(self, chunks: List[str]) -> np.ndarray:
+        paths = [self._embed_cache_path(ch) for ch in chunks]
+        rows: List[Optional[np.ndarray]] = [None] * len(chunks)
+        misses = []
+        for i, p in enumerate(paths):
+            if os.path.exists(p):
+                rows[i] = np.load(p, mmap_mode="r")
+            else:
+                misses.append(i)
+        if misses:
+            fresh = self.embedder.embed([chunks[i] for i in misses])
+            for j, i in enumerate(misses):
+                ensure_dir(os.path.dirname(paths[i]))
+                np.save(paths[i], fresh[j])
+                rows[i] = fresh[j]
+        return np.vstack(rows)
+
+    def _csv_lines(self, data: bytes) -> List[str]:
+        # Same output as csv.reader + ' | '.join below, but parsed by
+        # Arrow's multithreaded reader and joined with vectorized string
+        # kernels. The header row stays an ordinary data row, and empty
+        # lines keep their row number so tags don't shift. Every column is
+        # declared string up front (names are the autogenerated f0..fN) so
+        # Arrow's type inference can't rewrite cell text on headerless or
+        # numeric files ("001" -> "1", "1.50" -> "1.5", "TRUE" -> "true").
+        ncols = len(next(csv.reader(io.StringIO(data.decode("utf-8"), newline=""))))
+        table = pa_csv.read_csv(
+            pa.BufferReader(data),
+            read_options=pa_csv.ReadOptions(use_threads=True, autogenerate_column_names=True),
+            parse_options=pa_csv.ParseOptions(ignore_empty_lines=False),
+            convert_options=pa_csv.ConvertOptions(column_types={f"f{j}": pa.string() for j in range(ncols)}),
+        )
+        cols = [
+            pa.compute.utf8_trim_whitespace(pa.compute.fill_null(col, ""))
+            for col in table.columns
+        ]
+        if len(cols) == 1:
+            return cols[0].to_pylist()
+        joined = pa.compute.binary_join_element_wise(*cols, " | ")
+        # Blank lines surface as all-empty rows; emit "" for them so the
+        # empty-line check in the ingest loop skips them like the
+        # csv.reader path does, instead of indexing a ' |  | ' chunk.
+        nonempty = pa.compute.not_equal(cols[0], "")
+        for col in cols[1:]:
+            nonempty = pa.compute.or_(nonempty, pa.compute.not_equal(col, ""))
+        return pa.compute.if_else(nonempty, joined, "").to_pylist()
+
+    def _pdf_page_count(self, path: str) -> int:
+        # 0 when pdfinfo is unavailable or fails.
+        if pdfinfo_from_path is None:
+            return 0
+        try:
+            return int(pdfinfo_from_path(path, poppler_path=self.cfg.poppler_path)["Pages"])
+        except Exception:
+            return 0
+
+    def _render_pool(self) -> Optional[ProcessPoolExecutor]:
+        # One pool for the whole pipeline: on Windows (spawn) each worker
+        # re-imports this module, which is far too expensive to repeat for
+        # every PDF in a folder.
+        workers = os.cpu_count() or 1
+        if workers <= 1:
+            return None
+        if self._pdf_pool is None:
+            self._pdf_pool = ProcessPoolExecutor(max_workers=workers)
+        return self._pdf_pool
+
+    def _render_pdf_pages(self, path: str, pages: List[int]) -> List[Image.Image]:
+        # Rasterize the given 1-based pages; short contiguous runs go to
+        # Poppler in one call, anything larger fans out across the shared
+        # worker-process pool.
+        if pages and len(pages) <= 4 and pages == list(range(pages[0], pages[0] + len(pages))):
+            return convert_from_path(path, dpi=self.cfg.dpi, poppler_path=self.cfg.poppler_path,
+                                     first_page=pages[0], last_page=pages[-1])
+        pool = self._render_pool()
+        if pool is None:
+            return [_render_pdf_page(path, p, self.cfg.dpi, self.cfg.poppler_path) for p in pages]
+        futures = [pool.submit(_render_pdf_page, path, p, self.cfg.dpi, self.cfg.poppler_path)
+                   for p in pages]
+        return [fut.result() for fut in futures]
+
+    def _ocr_pdf(self, path: str, file_hash: str) -> List[str]:
+        # Probe the OCR cache before touching Poppler: re-ingesting an
+        # unchanged PDF costs one pdfinfo call, not a full render of every
+        # page at cfg.dpi. Only cache misses are rasterized.
+        n_pages = self._pdf_page_count(path)
+        if n_pages > 0:
+            texts: List[Optional[str]] = [self._ocr_cache_get(file_hash, i) for i in range(n_pages)]
+            misses = [i for i, t in enumerate(texts) if t is None]
+            if misses:
+                fresh = self._ocr_batch(self._render_pdf_pages(path, [i + 1 for i in misses]))
+                for i, t in zip(misses, fresh):
+                    texts[i] = t
+                    self._ocr_cache_put(file_hash, i, t)
+            return texts
+        # Page count unknown: render everything, the page cache still
+        # spares the OCR calls.
+        imgs = convert_from_path(path, dpi=self.cfg.dpi, poppler_path=self.cfg.poppler_path)
+        return self._ocr_pages(file_hash, imgs)
+
+    def _ocr_batch(self, imgs: List[Image.Image]) -> List[str]:
+        # Keep several page images in flight to the vision model at once;
+        # ex.map preserves input order.
+        if len(imgs) <= 1 or self.cfg.ocr_concurrency <= 1:
+            return [self.ocr.ocr_image(img) for img in imgs]
+        with ThreadPoolExecutor(max_workers=self.cfg.ocr_concurrency) as ex:
+            return list(ex.map(self.ocr.ocr_image, imgs))
+
+    def _ocr_paths(self, paths: List[str]) -> List[str]:
+        # Like _ocr_batch but over file paths: each worker opens its own
+        # image, so only ocr_concurrency file handles are live at once
+        # instead of one per pending image (which hits the fd limit on
+        # large folders).
+        def ocr_one(p: str) -> str:
+            return self.ocr.ocr_image(Image.open(p))
+
+        if len(paths) <= 1 or self.cfg.ocr_concurrency <= 1:
+            return [ocr_one(p) for p in paths]
+        with ThreadPoolExecutor(max_workers=self.cfg.ocr_concurrency) as ex:
+            return list(ex.map(ocr_one, paths))
+
+    # NEW: helper to make a compact "col=value | col=value" row string;
+    # scalar reference for one row, kept as the ground truth that the
+    # vectorized _format_df_rows below is cross-checked against
     def _format_df_row(self, cols: List[str], values: List[Any]) -> str:
         parts = []
         for c, v in zip(cols, values):
@@ -234,6 +699,24 @@ class RAGPipeline:
             parts.append(f"{c}={s}")
         return " | ".join(parts).strip()
 
+    # Same output as _format_df_row, vectorized over the whole sheet:
+    # fold the columns into the line accumulator, inserting " | " only
+    # when both sides are non-empty.
+    def _format_df_rows(self, df, cols: List[str]):
+        cells = df.astype(str).apply(lambda s: s.str.strip())
+        lowered = cells.apply(lambda s: s.str.lower())
+        cells = cells.mask(lowered.isin(["nan", "none"]), "")
+        lines = pd.Series("", index=df.index, dtype=object)
+        sep = pd.Series(" | ", index=df.index, dtype=object)
+        for j, name in enumerate(cols):
+            col = cells.iloc[:, j]
+            part = (name + "=" + col).where(col != "", "")
+            lines = lines + sep.where((lines != "") & (part != ""), "") + part
+        if len(lines):
+            assert lines.iloc[0] == self._format_df_row(cols, list(df.iloc[0])), \
+                "vectorized row formatting diverged from _format_df_row"
+        return lines
+
     def ingest_folder(self, folder: str) -> None:
         folder = os.path.abspath(folder)
         if not os.path.isdir(folder):
@@ -260,26 +743,71 @@ class RAGPipeline:
         if not files:
             raise RuntimeError("No supported files found in folder.")
 
+        # OCR standalone image files up front: serve unchanged files from the
+        # cache, OCR the rest concurrently. PDF pages are batched per
+        # document below.
+        img_files = [p for p in files if os.path.splitext(p.lower())[1] in exts_img]
+        img_hashes = {p: sha256_file(p) for p in img_files}
+        img_texts: Dict[str, str] = {}
+        img_misses = []
+        for p in img_files:
+            cached = self._ocr_cache_get(img_hashes[p])
+            if cached is None:
+                img_misses.append(p)
+            else:
+                img_texts[p] = cached
+        if img_misses:
+            fresh = self._ocr_paths(img_misses)
+            for p, t in zip(img_misses, fresh):
+                self._ocr_cache_put(img_hashes[p], 0, t)
+                img_texts[p] = t
+
+        # Prefetch text/CSV bytes on a small thread pool so disk reads overlap
+        # the hashing/OCR/parsing of earlier files. Submission is bounded: at
+        # most io_prefetch reads are in flight or retained at once, and each
+        # consumed file refills one slot, so peak memory stays at a few files
+        # instead of the whole corpus.
+        def read_bytes(p: str) -> bytes:
+            with open(p, "rb") as f:
+                if hasattr(os, "posix_fadvise"):
+                    os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_SEQUENTIAL)
+                return f.read()
+
+        prefetch_depth = max(1, self.cfg.io_prefetch)
+        prefetch_queue = [p for p in files if os.path.splitext(p.lower())[1] in (exts_txt | exts_csv)]
+        prefetch_pool = ThreadPoolExecutor(max_workers=prefetch_depth)
+        prefetch = {p: prefetch_pool.submit(read_bytes, p) for p in prefetch_queue[:prefetch_depth]}
+        prefetch_next = min(prefetch_depth, len(prefetch_queue))
+
+        def take_prefetched(p: str) -> bytes:
+            # Popping releases the bytes as the loop advances; files are
+            # consumed in submit order, so the head slot frees first.
+            nonlocal prefetch_next
+            data = prefetch.pop(p).result()
+            if prefetch_next < len(prefetch_queue):
+                nxt = prefetch_queue[prefetch_next]
+                prefetch[nxt] = prefetch_pool.submit(read_bytes, nxt)
+                prefetch_next += 1
+            return data
+
         all_chunks: List[str] = []
         meta: List[Dict[str, Any]] = []
 
         for path in tqdm(files, desc="Ingest files"):
             ext = os.path.splitext(path.lower())[1]
             rel = os.path.relpath(path, folder).replace("\\", "/")
-            file_hash = sha256_file(path)
+            file_hash = img_hashes.get(path) or sha256_file(path)
             prev[rel] = {"sha256": file_hash}
 
             if ext == ".pdf":
                 if convert_from_path is None:
                     raise RuntimeError("pdf2image not installed or failed to import.")
-                imgs = convert_from_path(path, dpi=self.cfg.dpi, poppler_path=self.cfg.poppler_path)
-                for i, img in enumerate(imgs):
+                page_texts = self._ocr_pdf(path, file_hash)
+                for i, text in enumerate(page_texts):
                     page = i + 1
-                    text = self.ocr.ocr_image(img)
-                    for ci, ch in enumerate(chunk_text(text, self.cfg.chunk_chars, self.cfg.chunk_overlap)):
+                    for ci, ch in enumerate(self._chunker(text)):
                         all_chunks.append(ch)
                         meta.append({
-                            "source": os.path.abspath(path),
                             "rel": rel,
                             "file_type": "pdf",
                             "page": page,
@@ -289,12 +817,10 @@ class RAGPipeline:
                         })
 
             elif ext in exts_img:
-                img = Image.open(path)
-                text = self.ocr.ocr_image(img)
-                for ci, ch in enumerate(chunk_text(text, self.cfg.chunk_chars, self.cfg.chunk_overlap)):
+                text = img_texts[path]
+                for ci, ch in enumerate(self._chunker(text)):
                     all_chunks.append(ch)
                     meta.append({
-                        "source": os.path.abspath(path),
                         "rel": rel,
                         "file_type": "image",
                         "page": None,
@@ -304,12 +830,10 @@ class RAGPipeline:
                     })
 
             elif ext in exts_txt:
-                with open(path, "r", encoding="utf-8", errors="ignore") as f:
-                    text = normalize_ws(f.read())
-                for ci, ch in enumerate(chunk_text(text, self.cfg.chunk_chars, self.cfg.chunk_overlap)):
+                text = normalize_ws(take_prefetched(path).decode("utf-8", errors="ignore"))
+                for ci, ch in enumerate(self._chunker(text)):
                     all_chunks.append(ch)
                     meta.append({
-                        "source": os.path.abspath(path),
                         "rel": rel,
                         "file_type": "text",
                         "page": None,
@@ -319,22 +843,28 @@ class RAGPipeline:
                     })
 
             elif ext in exts_csv:
-                with open(path, "r", encoding="utf-8", errors="ignore", newline="") as f:
-                    reader = csv.reader(f)
-                    for r_i, row in enumerate(reader):
-                        line = " | ".join([c.strip() for c in row if c is not None])
-                        if not line.strip():
-                            continue
-                        all_chunks.append(line)
-                        meta.append({
-                            "source": os.path.abspath(path),
-                            "rel": rel,
-                            "file_type": "csv",
-                            "row": r_i,
-                            "chunk_id": 0,
-                            "tag": f"[file:{rel} row{r_i:03d} c000]",
-                            "text": line,
-                        })
+                raw = take_prefetched(path)
+                lines = None
+                if pa_csv is not None:
+                    try:
+                        lines = self._csv_lines(raw)
+                    except Exception:
+                        lines = None  # ragged rows / bad UTF-8: use csv.reader
+                if lines is None:
+                    reader = csv.reader(io.StringIO(raw.decode("utf-8", errors="ignore"), newline=""))
+                    lines = [" | ".join([c.strip() for c in row if c is not None]) for row in reader]
+                for r_i, line in enumerate(lines):
+                    if not line.strip():
+                        continue
+                    all_chunks.append(line)
+                    meta.append({
+                        "rel": rel,
+                        "file_type": "csv",
+                        "row": r_i,
+                        "chunk_id": 0,
+                        "tag": f"[file:{rel} row{r_i:03d} c000]",
+                        "text": line,
+                    })
 
             # NEW: Excel (multi-sheet)
             elif ext in exts_xlsx:
@@ -342,8 +872,9 @@ class RAGPipeline:
                     raise RuntimeError("pandas not installed. Run: pip install pandas openpyxl")
 
                 # Read ALL sheets
-                # dtype=str keeps values as strings; engine auto-detected (openpyxl for xlsx/xlsm)
-                sheets = pd.read_excel(path, sheet_name=None, dtype=str)
+                # dtype=str keeps values as strings; calamine when installed,
+                # otherwise auto-detected (openpyxl for xlsx/xlsm)
+                sheets = pd.read_excel(path, sheet_name=None, dtype=str, engine=EXCEL_ENGINE)
 
                 for sheet_name, df in sheets.items():
                     if df is None or df.empty:
@@ -356,14 +887,12 @@ class RAGPipeline:
                     # Fill NaNs with empty string
                     df = df.fillna("")
 
-                    for r_i, row in enumerate(df.itertuples(index=False, name=None)):
-                        line = self._format_df_row(cols, list(row))
+                    for r_i, line in enumerate(self._format_df_rows(df, cols).tolist()):
                         if not line.strip():
                             continue
 
                         all_chunks.append(line)
                         meta.append({
-                            "source": os.path.abspath(path),
                             "rel": rel,
                             "file_type": "excel",
                             "sheet": sheet_name,
@@ -373,40 +902,70 @@ class RAGPipeline:
                             "text": line,
                         })
 
+        prefetch_pool.shutdown()
+
         if not all_chunks:
             raise RuntimeError("No text extracted from supported files.")
 
-        vectors = self.embedder.embed(all_chunks)
-        self.store.build(vectors)
-        self.meta = meta
+        # Byte-identical chunks (boilerplate headers, repeated form fields)
+        # embed to the same vector: index each unique chunk once and point
+        # duplicate meta rows at the shared FAISS row via vec_id.
+        unique_map: Dict[str, int] = {}
+        unique_chunks: List[str] = []
+        for m_i, ch in enumerate(all_chunks):
+            vec_id = unique_map.get(ch)
+            if vec_id is None:
+                vec_id = len(unique_chunks)
+                unique_map[ch] = vec_id
+                unique_chunks.append(ch)
+            meta[m_i]["vec_id"] = vec_id
+
+        vectors = self._embed_cached(unique_chunks)
+        # Exact search is fine (and simpler) for small corpora; go ANN above the threshold.
+        factory = self.cfg.index_factory if len(unique_chunks) >= self.cfg.index_factory_min_vectors else None
+        self.store.build(vectors, factory, self.cfg.quantizer)
 
         idx_path = os.path.join(self.cfg.work_dir, self.cfg.index_name)
         meta_path = os.path.join(self.cfg.work_dir, self.cfg.meta_name)
+        meta_blob_path = os.path.join(self.cfg.work_dir, self.cfg.meta_blob_name)
 
         self.store.save(idx_path)
-        with open(meta_path, "wb") as f:
-            pickle.dump(self.meta, f)
+        MetaStore.write(meta, meta_path, meta_blob_path)
+        self.meta = MetaStore(meta_path, meta_blob_path)
 
         manifest["files"] = prev
+        manifest["index_factory"] = self.store.factory
         self._save_manifest(manifest)
 
         print(f"Saved index: {idx_path}")
         print(f"Saved metadata: {meta_path}")
-        print(f"Chunks indexed: {len(self.meta)}")
+        print(f"Chunks indexed: {len(self.meta)} ({len(unique_chunks)} unique vectors)")
 
     def load(self) -> None:
         idx_path = os.path.join(self.cfg.work_dir, self.cfg.index_name)
         meta_path = os.path.join(self.cfg.work_dir, self.cfg.meta_name)
-        if not (os.path.exists(idx_path) and os.path.exists(meta_path)):
+        meta_blob_path = os.path.join(self.cfg.work_dir, self.cfg.meta_blob_name)
+        if not (os.path.exists(idx_path) and os.path.exists(meta_path) and os.path.exists(meta_blob_path)):
             raise FileNotFoundError("Index not found. Build index first.")
         self.store.load(idx_path)
-        with open(meta_path, "rb") as f:
-            self.meta = pickle.load(f)
+        self.store.factory = self._load_manifest().get("index_factory")
+        self.meta = MetaStore(meta_path, meta_blob_path)
 
     def query(self, question: str) -> str:
-        qvec = self.embedder.embed([question])[0]
-        _, idxs = self.store.search(qvec, self.cfg.top_k)
-        contexts = [self.meta[i] for i in idxs if i >= 0]
+        qvec = self.embedder.embed_one(question)
+        _, idxs = self.store.search(qvec, self.cfg.top_k, nprobe=self.cfg.nprobe)
+        contexts = []
+        for i in idxs:
+            if i < 0:
+                continue
+            rows = self.meta.rows_for_vec(int(i))
+            if not rows:
+                continue
+            c = self.meta[rows[0]]
+            if len(rows) > 1:
+                # Identical text in several places: cite every occurrence.
+                c["tag"] = " ".join(self.meta[r]["tag"] for r in rows)
+            contexts.append(c)
         if not contexts:
             return "I don't know (not in RAG folder)."
         return self.qa.answer(question, contexts)